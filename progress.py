@@ -3,25 +3,37 @@
 
 # see https://stackoverflow.com/questions/3002085/how-to-print-out-status-bar-and-percentage#answer-70586588
 import sys
+import functools
+
+# UTF-8 left blocks: 1, 1/8, 1/4, 3/8, 1/2, 5/8, 3/4, 7/8
+utf_8s = ["█", "▏", "▎", "▍", "▌", "▋", "▊", "█"]
+
+@functools.lru_cache(maxsize=None)
+def progress_bars(bar_width):
+    # Every possible bar for this width, indexed by number of 1/8 ticks
+    bars = []
+    for num_ticks in range(bar_width * 8 + 1):
+        full_ticks = num_ticks // 8     # Number of full blocks
+        part_ticks = num_ticks % 8      # Size of partial block (array index)
+
+        bar = utf_8s[0] * full_ticks    # Add full blocks into Progress Bar
+
+        # If part_ticks is zero, then no partial block, else append part char
+        if part_ticks > 0:
+            bar += utf_8s[part_ticks]
+
+        # Pad Progress Bar with fill character
+        bar += "▒" * int(bar_width - num_ticks / 8)
+        bars.append(bar)
+    return bars
 
 def percent_complete(step, total_steps, bar_width=60, title="", print_perc=True):
-    # UTF-8 left blocks: 1, 1/8, 1/4, 3/8, 1/2, 5/8, 3/4, 7/8
-    utf_8s = ["█", "▏", "▎", "▍", "▌", "▋", "▊", "█"]
-    perc = 100 * float(step) / float(total_steps)
+    perc = 100 * float(step) / float(total_steps) if total_steps else 100.0
     max_ticks = bar_width * 8
-    num_ticks = int(round(perc / 100 * max_ticks))
-    full_ticks = num_ticks / 8      # Number of full blocks
-    part_ticks = num_ticks % 8      # Size of partial block (array index)
-    
-    disp = bar = ""                 # Blank out variables
-    bar += utf_8s[0] * int(full_ticks)  # Add full blocks into Progress Bar
-    
-    # If part_ticks is zero, then no partial block, else append part char
-    if part_ticks > 0:
-        bar += utf_8s[part_ticks]
-    
-    # Pad Progress Bar with fill character
-    bar += "▒" * int((max_ticks/8 - float(num_ticks)/8.0))
+    num_ticks = min(max(int(round(perc / 100 * max_ticks)), 0), max_ticks)
+
+    disp = ""                       # Blank out variables
+    bar = progress_bars(bar_width)[num_ticks]
     
     if len(title) > 0:
         disp = title + ": "         # Optional title to progress display
@@ -2,24 +2,48 @@
 # -*- coding: utf-8 -*-
 
 import os
+import sys
+import time
 import argparse
+import collections
+import contextlib
+import email.utils
+import functools
 import hashlib
+import io
+import json
 import logging
 import urllib.parse
+import urllib.robotparser
+import uuid
+from typing import NamedTuple
 
 import asyncio
-import aiofiles
 import aiofiles.os
 import aiohttp
 
-from lxml import html
-from contextvars import ContextVar
+try:
+    import uvloop
+except ImportError: # uvloop does not support Windows
+    uvloop = None
+
+from lxml import etree, html
 
 from markitdown import MarkItDown
 
 from progress import percent_complete
 
-RequestFrequency = 5 # seconds / request
+ProgressInterval = 0.2 # min seconds between progress redraws
+ProgressTimeout = 1 # max seconds between progress redraws
+RequestDelay = 0.2 # min seconds between requests per host
+MaxRequestDelay = 30 # max seconds between requests per host when backing off
+MaxConcurrency = 16 # in-flight requests per host
+MaxRetries = 5 # retries on 429 Too Many Requests / 503 Service Unavailable
+RetryStatuses = (429, 503)
+MaxWorkers = 16 # concurrent scrape workers
+InlineIOLimit = 64 * 1024 # bytes, smaller files are read / written without a thread hop
+DownloadChunkSize = 64 * 1024 # bytes / network read
+DownloadFlushSize = 1024 * 1024 # bytes buffered before each disk write
 BaseURL = "https://learn.lianglianglee.com"
 BaseHeaders = {
     "user-agent":"Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/133.0.0.0 Safari/537.36"
@@ -27,182 +51,488 @@ BaseHeaders = {
 ObsidianVaultPath = "/Users/wheat/WorkSpace/notes/CS/TechDigest"
 Workspace = "/Users/wheat/WorkSpace/tmp"
 
-completed_task_count = ContextVar("completed_task_count", default=0)
-total_task_count = ContextVar("total_task_count", default=0)
+class Counter:
+    # shared by all workers on the event loop, unlike a ContextVar which each task copies
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0
+
+
+class ScrapeItem(NamedTuple):
+    title: str
+    href: str
+    column: str | None = None
+
+
+class ImgItem(NamedTuple):
+    download_url: str
+    output: str
+    column: str
+
+
+# progress counters keyed by column title
+completed_task_count = collections.defaultdict(Counter)
+total_task_count = collections.defaultdict(Counter)
+# set by workers whenever the progress counters change
+progress_event = asyncio.Event()
+
+BookPostXPath = "(//div[contains(concat(' ', normalize-space(@class), ' '), ' book-post ')])[1]"
+TocXPath = etree.XPath(f"{BookPostXPath}/descendant::ul[1]/*/descendant::a[1]")
+PostContentXPath = etree.XPath(f"{BookPostXPath}/descendant::div[p][1]")
+ImgXPath = etree.XPath(".//img")
 
 logger = logging.getLogger("spider")
 
 md = MarkItDown()
 
-async def create_dir_if_not_exists(path):
-    abs_path = os.path.expanduser(path)
-    if not await aiofiles.os.path.exists(abs_path):
-        await aiofiles.os.makedirs(abs_path)
+
+def parse_delay(value):
+    """Convert a Retry-After / X-RateLimit-Reset header value to seconds from now."""
+    if not value:
+        return None
+    try:
+        seconds = float(value)
+    except ValueError:
+        try:
+            seconds = email.utils.parsedate_to_datetime(value).timestamp() - time.time()
+        except (TypeError, ValueError):
+            return None
+    else:
+        # epoch timestamp rather than a delta
+        if seconds > 1e9:
+            seconds -= time.time()
+    return max(0.0, seconds)
+
+
+class TokenBucket:
+    """Paces requests to a single host.
+
+    Tokens refill at `rate` per second up to `capacity`. Rate limit headers
+    from the server pause the bucket until the advertised deadline.
+    """
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+        self.resume_at = 0.0
+        self.lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                if now < self.resume_at:
+                    await asyncio.sleep(self.resume_at - now)
+                    continue
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+                self.updated_at = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    def pause(self, seconds):
+        self.tokens = 0
+        self.resume_at = max(self.resume_at, time.monotonic() + seconds)
+        self.updated_at = self.resume_at
+
+    def update(self, headers):
+        retry_after = parse_delay(headers.get("Retry-After"))
+        if retry_after is not None:
+            self.pause(retry_after)
+        elif headers.get("X-RateLimit-Remaining") == "0":
+            reset = parse_delay(headers.get("X-RateLimit-Reset"))
+            self.pause(reset if reset is not None else 1 / self.rate)
+
+
+class HostLimiter:
+    """Concurrency cap plus an adaptive delay between requests to one host.
+
+    The delay halves after each successful response, down to `min_delay`,
+    and doubles on 429 / 503, up to MaxRequestDelay.
+    """
+
+    def __init__(self):
+        self.semaphore = asyncio.Semaphore(MaxConcurrency)
+        self.min_delay = RequestDelay
+        self.delay = RequestDelay
+        self.bucket = TokenBucket(1 / self.delay, 1)
+        self.robots = None
+
+    def set_robots(self, robots):
+        self.robots = robots
+        crawl_delay = robots.crawl_delay(BaseHeaders["user-agent"])
+        if crawl_delay:
+            self.min_delay = max(self.min_delay, float(crawl_delay))
+            self.delay = max(self.delay, self.min_delay)
+            self.bucket.rate = 1 / self.delay
+
+    def can_fetch(self, url):
+        return self.robots is None or self.robots.can_fetch(BaseHeaders["user-agent"], url)
+
+    def update(self, status, headers):
+        if status in RetryStatuses:
+            self.delay = min(MaxRequestDelay, self.delay * 2)
+        elif status < 400:
+            self.delay = max(self.min_delay, self.delay / 2)
+        self.bucket.rate = 1 / self.delay
+        self.bucket.update(headers)
+
+
+host_limiters = {}
+
+def get_host_limiter(url):
+    host = urllib.parse.urlsplit(url).netloc or urllib.parse.urlsplit(BaseURL).netloc
+    if host not in host_limiters:
+        host_limiters[host] = HostLimiter()
+    return host_limiters[host]
+
+
+@contextlib.asynccontextmanager
+async def throttled_get(session, url, **kwargs):
+    limiter = get_host_limiter(url)
+    if not limiter.can_fetch(url):
+        raise Exception(f"fetch {url} disallowed by robots.txt")
+
+    for attempt in range(MaxRetries + 1):
+        async with limiter.semaphore:
+            await limiter.bucket.acquire()
+            async with session.get(url, **kwargs) as resp:
+                limiter.update(resp.status, resp.headers)
+                if resp.status not in RetryStatuses or attempt == MaxRetries:
+                    yield resp
+                    return
+        logger.warning(f"fetch {url} failed with status {resp.status}, retry after {2 ** attempt}s")
+        await asyncio.sleep(2 ** attempt)
+
+
+async def load_robots(session):
+    # robots.txt is optional, keep the default pacing if it can't be read
+    async with throttled_get(session, "/robots.txt") as resp:
+        if resp.status != 200:
+            return
+        data = await resp.text()
+    robots = urllib.robotparser.RobotFileParser()
+    robots.parse(data.splitlines())
+    get_host_limiter("/").set_robots(robots)
+
+dir_listings = {}
+
+def list_dir(path):
+    # one listdir per directory for the whole run instead of a stat per file
+    if path not in dir_listings:
+        try:
+            dir_listings[path] = set(os.listdir(path))
+        except FileNotFoundError:
+            dir_listings[path] = set()
+    return dir_listings[path]
 
 
-async def fetch_html(session, url):
-    # avoid too many requests
-    await asyncio.sleep(RequestFrequency)
+def file_exists(file_path):
+    return os.path.basename(file_path) in list_dir(os.path.dirname(file_path))
 
-    async with session.get(url) as resp:
+
+def mark_file_exists(file_path):
+    list_dir(os.path.dirname(file_path)).add(os.path.basename(file_path))
+
+
+def _read_text(file_path):
+    with open(file_path, 'r') as f:
+        return f.read()
+
+
+def _write_file(file_path, data):
+    with open(file_path, 'w') as f:
+        f.write(data)
+
+
+async def read_text(file_path):
+    if os.path.getsize(file_path) < InlineIOLimit:
+        return _read_text(file_path)
+    return await asyncio.to_thread(_read_text, file_path)
+
+
+async def write_file(file_path, data):
+    # InlineIOLimit is in bytes, CJK text takes up to 3 bytes per character
+    if len(data.encode()) < InlineIOLimit:
+        _write_file(file_path, data)
+    else:
+        await asyncio.to_thread(_write_file, file_path, data)
+    mark_file_exists(file_path)
+
+
+@functools.lru_cache(maxsize=8192)
+def quote_path(path):
+    # make sure path is quoted, paths may come either quoted or unquoted
+    if urllib.parse.unquote(path) == path:
+        return urllib.parse.quote(path, safe='/')
+    return path
+
+
+@functools.lru_cache(maxsize=8192)
+def raw_file_name_of(file_name):
+    # the hash only makes a filesystem-safe name, keep md5 so existing workspaces stay valid
+    return f"{hashlib.md5(file_name.encode(), usedforsecurity=False).hexdigest()}.html"
+
+
+async def create_dir_if_not_exists(path):
+    abs_path = os.path.expanduser(path)
+    # concurrent workers may race to create the same directory
+    await aiofiles.os.makedirs(abs_path, exist_ok=True)
+
+
+async def load_validators(cache_path):
+    etag_path = f"{cache_path}.etag"
+    if not file_exists(cache_path) or not file_exists(etag_path):
+        return {}
+    return json.loads(await read_text(etag_path))
+
+
+async def fetch_html(session, url, cache_path=None):
+    # revalidate the cached copy with ETag / Last-Modified if we have one
+    headers = {}
+    if cache_path:
+        validators = await load_validators(cache_path)
+        if validators.get("ETag"):
+            headers["If-None-Match"] = validators["ETag"]
+        if validators.get("Last-Modified"):
+            headers["If-Modified-Since"] = validators["Last-Modified"]
+
+    async with throttled_get(session, url, headers=headers) as resp:
+        if resp.status == 304 and headers:
+            logger.debug("%s not modified, load from %s", url, cache_path)
+            return await read_text(cache_path)
         if resp.status != 200:
             raise Exception(f"fetch {url} failed, status: {resp.status}")
-        return await resp.text()
+        data = await resp.text()
+        validators = {k: resp.headers[k] for k in ("ETag", "Last-Modified") if k in resp.headers}
+
+    if cache_path and validators:
+        await create_dir_if_not_exists(os.path.dirname(cache_path))
+        await write_file(cache_path, data)
+        await write_file(f"{cache_path}.etag", json.dumps(validators))
+    return data
 
 
 async def dl_file(session, url, output):
     await create_dir_if_not_exists(os.path.dirname(output))
 
-    await asyncio.sleep(RequestFrequency)
-    async with session.get(url) as resp:
-        async with aiofiles.open(output, 'wb') as f:
-            await f.write(await resp.read())
-
-
-def parse_toc(html_content):
-    results = []
-
+    # stream into a .part file so an interrupted download is never mistaken for a finished one,
+    # unique per download so concurrent writers never share it
+    part_output = f"{output}.{uuid.uuid4().hex}.part"
+    async with throttled_get(session, url) as resp:
+        if resp.status != 200:
+            raise Exception(f"download {url} failed, status: {resp.status}")
+        try:
+            with open(part_output, 'xb') as f:
+                buf = bytearray()
+                async for chunk in resp.content.iter_chunked(DownloadChunkSize):
+                    buf += chunk
+                    if len(buf) >= DownloadFlushSize:
+                        await asyncio.to_thread(f.write, buf)
+                        buf.clear()
+                if buf:
+                    await asyncio.to_thread(f.write, buf)
+        except BaseException:
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(part_output)
+            raise
+    os.replace(part_output, output)
+    mark_file_exists(output)
+
+
+def parse_toc(html_content, column=None):
     doc = html.fromstring(html_content)
-    posts = doc.body.find_class('book-post')
-    if not posts:
-        return []
-
-    toc = posts[0].find('.//ul')
-    for item in toc.iterchildren():
-        tag_a = item.find('.//a')
-        if tag_a is not None:
-            item = {"type":"scrape", "title": tag_a.text, "href": tag_a.get('href')}
-            results.append(item)
-    return results
+    return [ScrapeItem(tag_a.text, tag_a.get('href'), column) for tag_a in TocXPath(doc)]
 
 
 async def get_root_toc(session, url_path):
-    html = await fetch_html(session, url_path)
+    html = await fetch_html(session, url_path, cache_path=os.path.join(Workspace, "index.html"))
     return parse_toc(html)
 
 
 async def get_sub_toc(queue, session, item):
-    url_path = item["href"]
-    html = await fetch_html(session, url_path)
-    sub_toc_list = parse_toc(html)
+    logger.info(f"start scraping: {item.title}")
+    url_path = item.href
+    html = await fetch_html(session, url_path, cache_path=os.path.join(Workspace, item.title, "index.html"))
+    sub_toc_list = parse_toc(html, column=item.title)
     for sub_toc in sub_toc_list:
-        sub_toc["column"] = item["title"]
         await queue.put(sub_toc)
-        total_task_count.set(total_task_count.get() + 1)
+        total_task_count[item.title].value += 1
+
+
+def html_to_markdown(data):
+    # convert from memory rather than reading the raw file back from disk
+    stream = io.BytesIO(data.encode("utf-8"))
+    return md.convert_stream(stream, file_extension=".html").text_content
 
 
 async def load_content_from_local(file_path):
-    async with aiofiles.open(file_path, 'r') as f:
-        data = await f.read()
-        data = f"<div class='book-post'><div>{data}</div></div>"
-        return data
+    data = await read_text(file_path)
+    return f"<div class='book-post'><div>{data}</div></div>"
 
 
-async def parse_imgs(content, queue, url_path, abs_parent_dir):
-    imgs = content.findall('.//img')
-    for img in imgs:
-        # make sure src is quoted
-        relative_path = img.get('src')
-        if relative_path == urllib.parse.unquote(relative_path):
-            relative_path = urllib.parse.quote(relative_path, safe='/')
+def parse_imgs(content, url_path):
+    imgs = []
+    url_dir = os.path.dirname(url_path)
+    for img in ImgXPath(content):
+        src = img.get('src')
+        relative_path = quote_path(src)
 
         # if file has no extension, add .png and update src
-        if len(img.get('src').split('.')) < 2:
-            img.set('src', f"{img.get('src')}.png")
+        if '.' not in src.rpartition('/')[2]:
+            src = f"{src}.png"
+            img.set('src', src)
+
+        imgs.append({"download_url": f"{url_dir}/{relative_path}", "src": src})
+    return imgs
 
-        download_url = f"{os.path.dirname(url_path)}/{relative_path}"
-        output = os.path.join(abs_parent_dir, img.get('src'))
-        item = {"type":"dl_img", "download_url": download_url, "output": output}
-        await queue.put(item)
-        total_task_count.set(total_task_count.get() + 1)
+
+async def put_imgs(queue, imgs, abs_parent_dir, column):
+    for img in imgs:
+        await queue.put(ImgItem(img["download_url"], os.path.join(abs_parent_dir, img["src"]), column))
+        total_task_count[column].value += 1
 
 
 async def scrape_and_persist(queue, session, item):
-    logger.debug("scrape_and_persist: %s-%s", item['column'], item['title'])
-    url_path = item["href"]
-    # make sure url_path is quoted
-    unquote_url_path = urllib.parse.unquote(url_path)
-    if unquote_url_path == url_path:
-        url_path = urllib.parse.quote(url_path, safe='/')
+    logger.debug("scrape_and_persist: %s-%s", item.column, item.title)
+    url_path = quote_path(item.href)
 
-    file_name = os.path.basename(item["href"])
-    raw_file_name = f"{hashlib.md5(file_name.encode()).hexdigest()}.html"
+    file_name = os.path.basename(item.href)
+    raw_file_name = raw_file_name_of(file_name)
 
-    column_dir = os.path.join(ObsidianVaultPath, item["column"])
-    raw_column_dir = os.path.join(Workspace, item["column"])
+    column_dir = os.path.join(ObsidianVaultPath, item.column)
+    raw_column_dir = os.path.join(Workspace, item.column)
 
     md_file_path = os.path.join(column_dir, file_name)
     raw_file_path = os.path.join(raw_column_dir, raw_file_name)
-
-    downloaded = await aiofiles.os.path.exists(raw_file_path)
-    processed = await aiofiles.os.path.exists(md_file_path)
-    if downloaded:
-        logger.info(f"file {raw_file_path} already exists. load from local")
-        data = await load_content_from_local(raw_file_path)
+    imgs_file_path = f"{raw_file_path}.imgs.json"
+
+    downloaded = file_exists(raw_file_path)
+    processed = file_exists(md_file_path)
+    if downloaded and file_exists(imgs_file_path):
+        # images were recorded when the article was first saved, no need to parse it again
+        logger.info(f"file {raw_file_path} already exists. load images from {imgs_file_path}")
+        imgs = json.loads(await read_text(imgs_file_path))
+        # the raw article is only needed again if it has not been converted yet
+        data = None if processed else await read_text(raw_file_path)
     else:
-        data = await fetch_html(session, url_path)
+        if downloaded:
+            logger.info(f"file {raw_file_path} already exists. load from local")
+            data = await load_content_from_local(raw_file_path)
+        else:
+            data = await fetch_html(session, url_path)
 
-    doc = html.fromstring(data)
-    posts = doc.body.find_class('book-post')
+        doc = html.fromstring(data)
+        contents = PostContentXPath(doc)
 
-    # if no posts element found, save the whole html
-    if not posts and not downloaded:
-        async with aiofiles.open(md_file_path, 'w') as f:
-            await f.write(data)
-        return
+        # if no post content found, save the whole html
+        if not contents:
+            if not downloaded:
+                await write_file(md_file_path, data)
+            return
 
-    post = posts[0]
-    content = post.find('.//div[p]')
-    # title = post.find('.//h1')
-    await parse_imgs(content, queue, url_path, column_dir)
+        content = contents[0]
+        imgs = parse_imgs(content, url_path)
 
-    if not downloaded:
+        # serialize straight to str, no per-element bytes -> str decode
+        data = '\n' + ''.join(html.tostring(child, encoding="unicode") for child in content)
+
+        # persist before converting, so a failed conversion doesn't force a refetch
         await create_dir_if_not_exists(raw_column_dir)
-        async with aiofiles.open(raw_file_path, 'w') as f:
-            data = ['\n']
-            for item in content.iterchildren():
-                data.append(html.tostring(item, encoding="utf-8").decode())
-            await f.write(''.join(data))
+        writes = [write_file(imgs_file_path, json.dumps(imgs, ensure_ascii=False))]
+        if not downloaded:
+            writes.append(write_file(raw_file_path, data))
+        await asyncio.gather(*writes)
+
+    await put_imgs(queue, imgs, column_dir, item.column)
 
     if not processed:
         await create_dir_if_not_exists(column_dir)
-        async with aiofiles.open(md_file_path, 'w') as f:
-            result = md.convert_local(raw_file_path)
-            await f.write(result.text_content)
+        # html -> markdown conversion is CPU bound, keep it off the event loop
+        markdown = await asyncio.to_thread(html_to_markdown, data)
+        await write_file(md_file_path, markdown)
+
 
+# output path -> task downloading it, the same image may be referenced more than once
+downloads = {}
 
 async def dl_img(session, item):
-    download = await aiofiles.os.path.exists(item["output"])
+    download = file_exists(item.output)
     if download:
-        logger.info(f"image {item['output']} already exists")
+        logger.info(f"image {item.output} already exists")
         return
-    await dl_file(session, item["download_url"], item["output"])
+    if item.output in downloads:
+        logger.info(f"image {item.output} already downloading")
+        # shield so a cancelled duplicate doesn't cancel the download it waits for
+        await asyncio.shield(downloads[item.output])
+        return
+
+    downloads[item.output] = asyncio.create_task(dl_file(session, item.download_url, item.output))
+    try:
+        await downloads[item.output]
+    finally:
+        del downloads[item.output]
 
 
 async def scrape_worker(queue, session):
-    while not queue.empty():
+    while True:
+        item = await queue.get()
+        # sentinel, the queue has been drained
+        if item is None:
+            queue.task_done()
+            return
         try:
-            item = await queue.get()
-            if item["type"] == "scrape":
+            if isinstance(item, ScrapeItem):
                 await scrape_and_persist(queue, session, item)
             else:
                 await dl_img(session, item)
-            completed_task_count.set(completed_task_count.get() + 1)
+            completed_task_count[item.column].value += 1
+        except Exception as e:
+            logger.error(f"scrape {item} failed, error: {e}", exc_info=True, stack_info=True)
+        finally:
+            queue.task_done()
+            progress_event.set()
+
+def progress_status(columns):
+    total_count = sum(total_task_count[column].value for column in columns)
+    completed_count = sum(completed_task_count[column].value for column in columns)
+    finished = sum(1 for column in columns
+                   if 0 < total_task_count[column].value <= completed_task_count[column].value)
+    title = f"columns: {finished}/{len(columns)}, total: {total_count}, completed: {completed_count}"
+    return completed_count, total_count, title
+
+
+async def progress_bar(done, columns):
+    while not done.is_set():
+        try:
+            await asyncio.wait_for(progress_event.wait(), timeout=ProgressTimeout)
+        except TimeoutError:
+            pass
+        progress_event.clear()
+        completed_count, total_count, title = progress_status(columns)
+        # a stalled terminal must not block the event loop
+        await asyncio.to_thread(percent_complete, completed_count, total_count, title=title)
+        # coalesce bursts of completions into one redraw
+        await asyncio.sleep(ProgressInterval)
+    completed_count, total_count, title = progress_status(columns)
+    await asyncio.to_thread(percent_complete, completed_count, total_count, title=title)
+
+
+async def produce_toc(queue, session, toc):
+    # fetch the TOC of every column concurrently, workers start on whichever arrives first
+    async def produce(item):
+        try:
+            await get_sub_toc(queue, session, item)
         except Exception as e:
-            logger.error(f"scrape {item['href']} failed, error: {e}", exc_info=True, stack_info=True)
-
-async def progress_bar(queue, item_title):
-    total_count = total_task_count.get()
-    completed_count = completed_task_count.get()
-    while not queue.empty():
-        await asyncio.sleep(RequestFrequency)
-        total_count = total_task_count.get()
-        completed_count = completed_task_count.get()
-        title = f"{item_title}, total: {total_count}, completed: {completed_count}"
-        percent_complete(completed_count, total_count, title=title)
-    await asyncio.sleep(RequestFrequency)
-    total_count = total_task_count.get()
-    percent_complete(total_count, total_count, title=title)
+            logger.error(f"get toc of {item.title} failed, error: {e}", exc_info=True, stack_info=True)
+
+    async with asyncio.TaskGroup() as tg:
+        for item in toc:
+            tg.create_task(produce(item))
 
 
 def generate_toc(root_toc, args):
@@ -211,17 +541,17 @@ def generate_toc(root_toc, args):
         logger.info("scrape all columns")
         return root_toc
     elif args.columns:
-        toc = [item for item in root_toc if item["title"] in args.columns]
-        logger.info("scrape specific columns: %s", '\n'.join([item["title"] for item in toc]))
+        toc = [item for item in root_toc if item.title in args.columns]
+        logger.info("scrape specific columns: %s", '\n'.join([item.title for item in toc]))
         return toc
     elif args.range:
         start, end = args.range.split('-')
         toc = root_toc[int(start)-1:int(end)]
-        logger.info("scrape specific range of columns: %s", '\n'.join([item["title"] for item in toc]))
+        logger.info("scrape specific range of columns: %s", '\n'.join([item.title for item in toc]))
         return toc
     elif args.keyword:
-        toc = [item for item in root_toc if args.keyword in item["title"]]
-        logger.info("scrape columns with keyword: %s", '\n'.join([item["title"] for item in toc]))
+        toc = [item for item in root_toc if args.keyword in item.title]
+        logger.info("scrape columns with keyword: %s", '\n'.join([item.title for item in toc]))
         return toc
     else:
         return []
@@ -252,29 +582,35 @@ async def main():
 
     queue = asyncio.Queue()
 
-    completed_task_count.set(0)
-    total_task_count.set(0)
-
-    context = asyncio.current_task().get_context()
-
     # disable ssl verification
-    connector = aiohttp.TCPConnector(keepalive_timeout=60, ssl=False)
+    # keep one pool of warm connections per host, sized to the per-host request cap
+    connector = aiohttp.TCPConnector(
+        limit=64,
+        limit_per_host=MaxConcurrency,
+        ttl_dns_cache=300,
+        keepalive_timeout=60,
+        # abort leaked SSL transports, only needed before https://github.com/python/cpython/pull/118960
+        enable_cleanup_closed=sys.version_info < (3, 12, 7) or (3, 13, 0) <= sys.version_info < (3, 13, 1),
+        ssl=False,
+    )
     async with aiohttp.ClientSession(base_url=BaseURL, headers=BaseHeaders, connector=connector) as session:
         logger.info(f"\nstart scraping {BaseURL}")
+        await load_robots(session)
         root_toc = await get_root_toc(session, "/")
         toc = generate_toc(root_toc, args)
-        for item in toc:
-            # reset progress
-            completed_task_count.set(0)
-            total_task_count.set(0)
-
-            logger.info(f"start scraping: {item['title']}")
-            await get_sub_toc(queue, session, item)
 
-            progress = asyncio.create_task(progress_bar(queue, item["title"]), context=context)
-            worker = asyncio.create_task(scrape_worker(queue, session), context=context)
-            await worker
-            await progress
+        done = asyncio.Event()
+        progress = asyncio.create_task(progress_bar(done, [item.title for item in toc]))
+        async with asyncio.TaskGroup() as tg:
+            workers = [tg.create_task(scrape_worker(queue, session)) for _ in range(MaxWorkers)]
+            await produce_toc(queue, session, toc)
+            # workers enqueue images while scraping, so only stop them once everything is done
+            await queue.join()
+            for _ in workers:
+                await queue.put(None)
+        done.set()
+        progress_event.set()
+        await progress
     
     # Graceful Shutdown
     # To avoid "ResourceWarning: unclosed transport" warning
@@ -282,5 +618,8 @@ async def main():
     await asyncio.sleep(2)    
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    if uvloop is not None:
+        uvloop.run(main())
+    else:
+        asyncio.run(main())
 